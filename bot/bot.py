@@ -13,6 +13,16 @@ DISCORD_TOKEN = os.getenv("DISCORD_TOKEN")
 REDIS_HOST = os.getenv("REDIS_HOST", "localhost")  # Default to 'localhost' if not set
 REDIS_PORT = int(os.getenv("REDIS_PORT", 6379))  # Default to 6379 if not set
 
+# Sharding: unset SHARD_COUNT lets Discord recommend one. SHARD_IDS restricts this
+# process to a subset of shards (set by cluster.py for multi-process clusters).
+SHARD_COUNT = int(os.getenv("SHARD_COUNT")) if os.getenv("SHARD_COUNT") else None
+SHARD_IDS = (
+    [int(i) for i in os.getenv("SHARD_IDS").split(",")]
+    if os.getenv("SHARD_IDS")
+    else None
+)
+CLUSTER_ID = os.getenv("CLUSTER_ID", "0")
+
 # ------------------------------------------------------------
 # LOGGING
 
@@ -20,7 +30,7 @@ import logging
 
 logging.basicConfig(
     level=logging.INFO,  # Change to DEBUG for more detailed logs
-    format="%(asctime)s - %(levelname)s - %(message)s",
+    format=f"%(asctime)s - cluster {CLUSTER_ID} - %(levelname)s - %(message)s",
     handlers=[
         logging.FileHandler("bot.log"),  # Save logs to a file
         logging.StreamHandler(),  # Output logs to the console
@@ -85,11 +95,105 @@ def remove_user_alerts(user_id: str, address: str = None):
     redis_client.delete(*keys)
 
 
+# ------------------------------------------------------------
+# ALERT LEASES
+# Alert definitions are stored in Redis so any cluster can resume an alert whose
+# process went away. The cluster running an alert holds a lease on it and renews
+# it on every check; an expired lease marks the alert as orphaned.
+
+import json
+import uuid
+
+import redis.asyncio as aioredis
+
+# These run on the event loop while alerts are active, so they use the asyncio client
+async_redis_client = aioredis.Redis(
+    host=REDIS_HOST, port=REDIS_PORT, decode_responses=True
+)
+
+LEASE_TTL = 30  # seconds a lease lasts without renewal
+LEASE_OWNER = f"{CLUSTER_ID}:{uuid.uuid4().hex}"  # unique per process
+
+# Only touch the lease if this process still owns it
+renew_lease = async_redis_client.register_script(
+    "if redis.call('get', KEYS[1]) == ARGV[1] then "
+    "return redis.call('expire', KEYS[1], ARGV[2]) else return 0 end"
+)
+release_lease = async_redis_client.register_script(
+    "if redis.call('get', KEYS[1]) == ARGV[1] then "
+    "return redis.call('del', KEYS[1]) else return 0 end"
+)
+
+
+def alert_key(alert: dict) -> str:
+    return f"{alert['user_id']}:{alert['address']}:{alert['metric']}:{alert['direction']}:{alert['threshold']}"
+
+
+async def alert_exists(alert: dict) -> bool:
+    return bool(await async_redis_client.exists(alert_key(alert)))
+
+
+async def save_alert_definition(alert: dict, max_timeout: int):
+    # Store what is needed to resume the alert and route its notifications
+    await async_redis_client.setex(
+        f"alertdef:{alert_key(alert)}", max_timeout * 60, json.dumps(alert)
+    )
+
+
+async def remove_alert_definition(alert: dict):
+    await async_redis_client.delete(f"alertdef:{alert_key(alert)}")
+
+
+async def get_alert_definitions() -> list:
+    alerts = []
+    batch = []
+    async for key in async_redis_client.scan_iter("alertdef:*", count=500):
+        batch.append(key)
+        if len(batch) >= 500:
+            alerts.extend(await load_alert_definitions(batch))
+            batch = []
+    if batch:
+        alerts.extend(await load_alert_definitions(batch))
+    return alerts
+
+
+async def load_alert_definitions(keys: list) -> list:
+    values = await async_redis_client.mget(keys)
+    return [json.loads(data) for data in values if data]
+
+
+async def claim_alert(alert: dict) -> bool:
+    return bool(
+        await async_redis_client.set(
+            f"alertlease:{alert_key(alert)}", LEASE_OWNER, nx=True, ex=LEASE_TTL
+        )
+    )
+
+
+async def renew_alert(alert: dict, ttl: int = LEASE_TTL) -> bool:
+    # The ttl must outlast the wait until the next renewal
+    return bool(
+        await renew_lease(
+            keys=[f"alertlease:{alert_key(alert)}"], args=[LEASE_OWNER, ttl]
+        )
+    )
+
+
+async def release_alert(alert: dict):
+    await release_lease(keys=[f"alertlease:{alert_key(alert)}"], args=[LEASE_OWNER])
+
+
 # ------------------------------------------------------------
 # COIN TRACKING
 
-from data import get_market_cap, list_pairs, search_pairs
+from data import BACKOFF_CAP, backoff_delay, list_pairs, search_pairs
+from engine import watch_alert
 from models import Pair
+from polling import FairPoller
+from sources import PAUSE_AFTER, DexScreenerSource, PriceSource
+
+price_source = DexScreenerSource()
+poller = FairPoller()
 
 
 async def prompt_user_for_selection(ctx, queries) -> Pair:
@@ -302,74 +406,146 @@ async def prompt_user_for_metric(ctx, pair) -> tuple:
         return None, None, None
 
 
-# Utility function to get the value of a metric for a coin
-async def get_metric_value(address: str, metric: str) -> float:
-    if metric != "market_cap":
-        logging.warning(f"Unsupported metric: {metric}.")
-        return None
-
-    return await get_market_cap(address)
-
-
 async def monitor_coin_metric(
-    ctx, address: str, metric: str, direction: str, threshold: float, max_timeout: int
+    ctx,
+    address: str,
+    metric: str,
+    direction: str,
+    threshold: float,
+    max_timeout: int,
+    source: PriceSource = price_source,
 ):
     """
     Monitor a coin's metric and send an alert when the threshold is crossed in the specified direction.
     """
 
+    alert = {
+        "user_id": ctx.author.id,
+        "guild_id": ctx.guild.id if ctx.guild else None,
+        "channel_id": ctx.channel.id,
+        "address": address,
+        "metric": metric,
+        "direction": direction,
+        "threshold": threshold,
+    }
+    # Claim first so a duplicate never overwrites the running alert's definition
+    if not await claim_alert(alert):
+        logging.info(f"Alert {alert_key(alert)} is already running elsewhere.")
+        await ctx.send(
+            f"An alert on `{address}` `{metric}` going `{direction}` `{threshold}` already exists."
+        )
+        return
+
     add_alert_to_redis(
         ctx.author.id, address, metric, direction, threshold, max_timeout
     )
+    await save_alert_definition(alert, max_timeout)
+    await run_alert(alert, source)
 
-    failed_attempts = 0
-    max_attempts = 3
-    while is_active_alert(ctx.author.id, address, metric, direction, threshold):
-        current_value = await get_metric_value(address, metric)
-        if current_value is None:
-            failed_attempts += 1
-            if failed_attempts >= max_attempts:
-                logging.error(
-                    f"Failed to fetch {metric} for {address} after {max_attempts} consequitive attempts."
-                )
-                remove_alert_from_redis(
-                    ctx.author.id, address, metric, direction, threshold
-                )
-                await ctx.send(
-                    f"{max_attempts}: Failed to fetch `{metric}` for `{address}`. Alert removed."
-                )
-                return
 
-            await ctx.send(
-                f"{failed_attempts}: Failed to fetch `{metric}` for `{address}`. Retrying..."
-            )
-            logging.warning(f"Failed to fetch {metric} for {address}. Retrying...")
-            await asyncio.sleep(5)
-            continue
+async def run_alert(alert: dict, source: PriceSource = price_source):
+    """
+    Run an alert this process holds the lease for, then release the lease.
+    """
+    poller.register(alert["user_id"], alert["guild_id"])
+    try:
+        await watch_coin_metric(alert, source)
+    finally:
+        poller.unregister(alert["user_id"], alert["guild_id"])
+        await release_alert(alert)
+
 
-        failed_attempts = 0  # Reset failed attempts
-        if (direction == "above" and current_value > threshold) or (
-            direction == "below" and current_value < threshold
-        ):
+async def watch_coin_metric(alert: dict, source: PriceSource):
+    """
+    Poll a coin's metric through the fair poller until the alert triggers or expires.
+    """
 
-            remove_alert_from_redis(
-                ctx.author.id, address, metric, direction, threshold
+    user_id, guild_id = alert["user_id"], alert["guild_id"]
+    address, metric = alert["address"], alert["metric"]
+    direction, threshold = alert["direction"], alert["threshold"]
+    lease_lost = False
+
+    async def fetch(address: str, metric: str) -> float:
+        return await poller.poll(user_id, source.get_value, address, metric)
+
+    def interval() -> float:
+        return poller.interval(user_id, guild_id)
+
+    async def is_active() -> bool:
+        nonlocal lease_lost
+        # Keep the lease past the longest wait before the next check
+        ttl = int(LEASE_TTL + max(interval(), BACKOFF_CAP))
+        if not await renew_alert(alert, ttl):
+            lease_lost = True
+            return False
+        return await alert_exists(alert)
+
+    async def on_event(event: str, value: float):
+        if event == "paused":
+            logging.error(
+                f"Failed to fetch {metric} for {address} after {PAUSE_AFTER} consecutive attempts. Alert paused."
             )
-            await ctx.send(
-                f"{ctx.author.mention} Alert! `{address}` `{metric}` is now `{direction}` `{threshold}`. Current value: `{current_value}`."
+            await notify(
+                alert,
+                f"Upstream unavailable: alert on `{address}` `{metric}` is paused and will resume automatically.",
+            )
+        elif event == "resumed":
+            logging.info(f"Alert on {address} {metric} resumed.")
+            await notify(alert, f"Alert on `{address}` `{metric}` resumed.")
+        elif event == "invalid":
+            logging.error(f"Failed to fetch {metric} for {address}. Alert removed.")
+            remove_alert_from_redis(user_id, address, metric, direction, threshold)
+            await notify(
+                alert, f"Failed to fetch `{metric}` for `{address}`. Alert removed."
+            )
+        elif event == "triggered":
+            remove_alert_from_redis(user_id, address, metric, direction, threshold)
+            await notify(
+                alert,
+                f"<@{user_id}> Alert! `{address}` `{metric}` is now `{direction}` `{threshold}`. Current value: `{value}`.",
             )
-            return
 
-        await asyncio.sleep(5)  # Wait for 5 sec before checking again
+    finished = await watch_alert(source, alert, fetch, interval, is_active, on_event)
+    if lease_lost:
+        logging.warning(f"Lost the lease on alert {alert_key(alert)}. Stopping.")
+        return
 
-    await ctx.send(
-        f"Timeout reached for alert on `{address}` `{metric}`. `{metric}` did not go `{direction}` `{threshold}`."
+    await remove_alert_definition(alert)
+    if finished:
+        return
+
+    await notify(
+        alert,
+        f"Timeout reached for alert on `{address}` `{metric}`. `{metric}` did not go `{direction}` `{threshold}`.",
     )
     logging.info(
         f"Timeout reached for alert on {address} {metric}. {metric} did not go {direction} {threshold}."
     )
 
 
+async def resume_orphaned_alerts():
+    """
+    Periodically take over alerts whose lease expired, e.g. because the cluster
+    running them stopped. The alert may belong to a channel on another cluster's
+    shard; its notifications are routed there by `notify`.
+    """
+    running = set()
+    while True:
+        await asyncio.sleep(LEASE_TTL)
+        try:
+            for alert in await get_alert_definitions():
+                if not await alert_exists(alert):
+                    await remove_alert_definition(alert)
+                    continue
+                if await claim_alert(alert):
+                    logging.info(f"Resuming orphaned alert {alert_key(alert)}.")
+                    task = asyncio.create_task(run_alert(alert))
+                    running.add(task)
+                    task.add_done_callback(running.discard)
+        except redis.RedisError as e:
+            logging.error(f"Failed to scan for orphaned alerts: {e}")
+
+
 # ------------------------------------------------------------
 # DISCORD BOT
 import asyncio
@@ -381,8 +557,14 @@ from discord.ext import commands
 intents = discord.Intents.default()
 intents.message_content = True  # Enable message content intent
 
-# Create a bot instance with the necessary intents
-bot = commands.Bot(command_prefix="!", intents=intents)
+# Create a bot instance with the necessary intents. AutoShardedBot runs every
+# shard in SHARD_IDS (or all shards) over one process's event loop.
+bot = commands.AutoShardedBot(
+    command_prefix="!",
+    intents=intents,
+    shard_count=SHARD_COUNT,
+    shard_ids=SHARD_IDS,
+)
 
 # Maximum timeout for alerts (in minutes)
 MAX_TIMEOUT = 60
@@ -417,6 +599,19 @@ async def alert(ctx, *queries):
         )
         return
 
+    existing = {
+        "user_id": ctx.author.id,
+        "address": pair.pairAddress,
+        "metric": metric,
+        "direction": dir,
+        "threshold": thresh,
+    }
+    if await alert_exists(existing):
+        await ctx.send(
+            f"You already have an alert on `{pair.baseToken.symbol}/{pair.quoteToken.symbol}` `{metric}` going `{dir}` `{thresh}`."
+        )
+        return
+
     # Confirm alert setup
     await ctx.send(
         f"Alert set for pair `{pair.baseToken.symbol}/{pair.quoteToken.symbol}`:`{metric}` going `{dir}` `{thresh}`. Timeout: `{MAX_TIMEOUT}` minutes."
@@ -472,6 +667,45 @@ async def alert_list(ctx):
     await ctx.send(f"Your alerts:\n{alert_list}")
 
 
+# Subcommand for 'usage' (bot owner only)
+@alert.command(name="usage")
+@commands.is_owner()
+async def alert_usage(ctx):
+    """
+    Show current polling usage per user and guild.
+    """
+    usage = poller.usage()
+    lines = [
+        f"Rate: `{usage['rate']}`/s | Load: `{usage['load']:.2f}` | Queued: `{usage['queued']}`"
+    ]
+    for user_id, u in usage["users"].items():
+        lines.append(
+            f"- user `{user_id}`: `{u['alerts']}` alerts, `{u['polls']}` polls, `{u['queued']}` queued, weight `{u['weight']}`, every `{u['interval']:.0f}`s"
+        )
+    for guild_id, g in usage["guilds"].items():
+        lines.append(
+            f"- guild `{guild_id}`: `{g['alerts']}` alerts, every `{g['interval']:.0f}`s"
+        )
+    await ctx.send("\n".join(lines))
+
+
+# Subcommand for 'weight' (bot owner only)
+@alert.command(name="weight")
+@commands.is_owner()
+async def alert_weight(ctx, user: discord.User, weight: float):
+    """
+    Set a user's share of the polling budget (default 1).
+    """
+    try:
+        poller.set_weight(user.id, weight)
+    except ValueError as e:
+        await ctx.send(f"{e}.")
+        return
+
+    await ctx.send(f"Polling weight for `{user}` set to `{weight}`.")
+    logging.info(f"Polling weight for {user} set to {weight} by {ctx.author}.")
+
+
 # Subcommand for 'help'
 @alert.command(name="help")
 async def alert_help(ctx):
@@ -491,10 +725,85 @@ async def alert_help(ctx):
     await ctx.send(help_text)
 
 
+# ------------------------------------------------------------
+# SHARD ROUTING
+
+
+def shard_for(guild_id) -> int:
+    """
+    The shard that owns a guild (DMs are always delivered on shard 0).
+    """
+    if guild_id is None:
+        return 0
+    return (guild_id >> 22) % bot.shard_count
+
+
+async def send_to_channel(channel_id: int, content: str):
+    channel = bot.get_channel(channel_id) or await bot.fetch_channel(channel_id)
+    await channel.send(content)
+
+
+async def notify(alert: dict, content: str):
+    """
+    Send an alert notification to the channel the alert was set in. If this
+    cluster does not run the shard that owns the channel, the message is
+    published to that shard's Redis channel and delivered by its cluster.
+    """
+    shard_id = shard_for(alert["guild_id"])
+    if shard_id in bot.shards:
+        await send_to_channel(alert["channel_id"], content)
+        return
+
+    receivers = await async_redis_client.publish(
+        f"alerts:shard:{shard_id}",
+        json.dumps({"channel_id": alert["channel_id"], "content": content}),
+    )
+    if not receivers:
+        logging.error(
+            f"No cluster is listening for shard {shard_id}. Dropped notification for channel {alert['channel_id']}: {content}"
+        )
+
+
+async def deliver_notifications():
+    """
+    Deliver notifications published for the shards run by this cluster,
+    reconnecting with backoff if the Redis connection drops.
+    """
+    channels = [f"alerts:shard:{shard_id}" for shard_id in bot.shards]
+    attempt = 0
+    while True:
+        client = aioredis.Redis(host=REDIS_HOST, port=REDIS_PORT, decode_responses=True)
+        pubsub = client.pubsub()
+        try:
+            await pubsub.subscribe(*channels)
+            attempt = 0
+            async for message in pubsub.listen():
+                if message["type"] != "message":
+                    continue
+                try:
+                    data = json.loads(message["data"])
+                    await send_to_channel(data["channel_id"], data["content"])
+                except Exception as e:
+                    logging.error(
+                        f"Failed to deliver notification {message['data']}: {e}"
+                    )
+        except redis.RedisError as e:
+            attempt += 1
+            logging.error(f"Notification subscriber disconnected: {e}. Reconnecting...")
+            await asyncio.sleep(backoff_delay(attempt))
+        finally:
+            await pubsub.aclose()
+            await client.aclose()
+
+
 # Example on_ready event
 @bot.event
 async def on_ready():
-    logging.info(f"Bot is logged in: {bot.user}.")
+    logging.info(f"Bot is logged in: {bot.user} with shards {sorted(bot.shards)}.")
+    if not getattr(bot, "delivery_task", None) or bot.delivery_task.done():
+        bot.delivery_task = asyncio.create_task(deliver_notifications())
+    if not getattr(bot, "resume_task", None) or bot.resume_task.done():
+        bot.resume_task = asyncio.create_task(resume_orphaned_alerts())
 
 
 """@bot.event
@@ -0,0 +1,104 @@
+import argparse
+import logging
+import os
+import subprocess
+import sys
+
+import requests
+from dotenv import load_dotenv
+
+# -------------------- Shard Clusters -----------------------------------------
+
+load_dotenv()
+
+from polling import UPSTREAM_RPS
+
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+BOT_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bot.py")
+
+
+def recommended_shards(token: str) -> int:
+    """
+    Ask Discord how many shards the bot should run
+
+        Parameters:
+            token (str): The bot token
+
+        Returns:
+            int: The recommended shard count
+    """
+    response = requests.get(
+        "https://discord.com/api/v10/gateway/bot",
+        headers={"Authorization": f"Bot {token}"},
+        timeout=10,
+    )
+    response.raise_for_status()
+    return response.json()["shards"]
+
+
+def split_shards(shard_count: int, clusters: int) -> list[list[int]]:
+    """
+    Split shard ids into contiguous ranges, one per cluster
+    """
+    size, extra = divmod(shard_count, clusters)
+    ranges = []
+    start = 0
+    for i in range(clusters):
+        end = start + size + (1 if i < extra else 0)
+        ranges.append(list(range(start, end)))
+        start = end
+    return [r for r in ranges if r]
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Run the bot as shard clusters, one process per cluster."
+    )
+    parser.add_argument(
+        "--clusters",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="Number of processes (default: CPU count)",
+    )
+    parser.add_argument(
+        "--shards",
+        type=int,
+        default=int(os.getenv("SHARD_COUNT", 0)),
+        help="Total shard count (default: SHARD_COUNT or Discord's recommendation)",
+    )
+    args = parser.parse_args()
+
+    shard_count = args.shards or recommended_shards(os.getenv("DISCORD_TOKEN"))
+    clusters = split_shards(shard_count, args.clusters)
+    # Each cluster polls independently, so split the upstream budget between them
+    rate = UPSTREAM_RPS / len(clusters)
+
+    processes = []
+    for cluster_id, shard_ids in enumerate(clusters):
+        env = dict(
+            os.environ,
+            SHARD_COUNT=str(shard_count),
+            SHARD_IDS=",".join(map(str, shard_ids)),
+            CLUSTER_ID=str(cluster_id),
+            UPSTREAM_RPS=str(rate),
+        )
+        logging.info(
+            f"Starting cluster {cluster_id} with shards {shard_ids} at {rate} requests/s."
+        )
+        processes.append(subprocess.Popen([sys.executable, BOT_SCRIPT], env=env))
+
+    try:
+        for process in processes:
+            process.wait()
+    except KeyboardInterrupt:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,326 @@
+import asyncio
+import json
+import logging
+import os
+import random
 import sys
+import time
+from collections import OrderedDict
+from concurrent.futures import (
+    BrokenExecutor,
+    Executor,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+)
 from datetime import datetime
 
 import requests
 from models import Pair
+from negcache import negative_cache
+
+# -------------------- Resilience ---------------------------------------------
+
+TOKENS_URL = "https://api.dexscreener.com/latest/dex/tokens/{}"
+SEARCH_URL = "https://api.dexscreener.com/latest/dex/search?q={}"
+
+REQUEST_TIMEOUT = float(os.getenv("REQUEST_TIMEOUT", 10))  # seconds
+MAX_RETRIES = int(os.getenv("MAX_RETRIES", 3))  # attempts per fetch
+BACKOFF_BASE = float(os.getenv("BACKOFF_BASE", 0.5))  # seconds
+BACKOFF_CAP = float(os.getenv("BACKOFF_CAP", 30))  # seconds
+BREAKER_THRESHOLD = int(os.getenv("BREAKER_THRESHOLD", 5))  # failures to open
+BREAKER_RESET = float(os.getenv("BREAKER_RESET", 30))  # seconds before probing
+HEDGE_DELAY = float(os.getenv("HEDGE_DELAY", 0))  # seconds, 0 disables hedging
+MAX_STALE = float(os.getenv("MAX_STALE", 300))  # seconds a snapshot may be served
+SNAPSHOT_CACHE_SIZE = int(os.getenv("SNAPSHOT_CACHE_SIZE", 1024))  # urls kept
+PARSE_EXECUTOR = os.getenv("PARSE_EXECUTOR", "thread")  # "thread" or "process"
+PARSE_WORKERS = int(os.getenv("PARSE_WORKERS", min(4, os.cpu_count() or 1)))
+PARSE_MAX_PENDING = int(os.getenv("PARSE_MAX_PENDING", 32))  # queued + running
+
+
+class UpstreamError(Exception):
+    """Raised when an upstream fetch fails and no usable snapshot is cached."""
+
+
+class CircuitBreaker:
+    """
+    Per-endpoint circuit breaker.
+
+    Closed: requests flow normally. After `threshold` consecutive failures the
+    breaker opens and rejects requests for `reset_timeout` seconds, then lets a
+    single probe through (half-open). A successful probe closes it again.
+    """
+
+    def __init__(self, threshold: int, reset_timeout: float):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half-open" and not self.probing:
+            self.probing = True
+            return True
+        return False
+
+    def record_success(self):
+        if self.opened_at is not None:
+            logging.info("Circuit closed: upstream recovered.")
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+
+    def release_probe(self):
+        """Give up a half-open probe without judging the upstream."""
+        self.probing = False
+
+    def record_failure(self):
+        self.failures += 1
+        self.probing = False
+        if self.opened_at is not None or self.failures >= self.threshold:
+            if self.opened_at is None:
+                logging.warning(f"Circuit opened after {self.failures} failures.")
+            self.opened_at = time.monotonic()
+
+    def retry_after(self) -> float:
+        """Seconds until the breaker will accept a probe (0 if closed)."""
+        if self.opened_at is None:
+            return 0.0
+        return max(0.0, self.reset_timeout - (time.monotonic() - self.opened_at))
+
+
+breakers = {
+    "tokens": CircuitBreaker(BREAKER_THRESHOLD, BREAKER_RESET),
+    "search": CircuitBreaker(BREAKER_THRESHOLD, BREAKER_RESET),
+}
+
+# url -> (monotonic timestamp, pairs) of the last successful non-empty response,
+# oldest first. Bounded by SNAPSHOT_CACHE_SIZE and MAX_STALE.
+snapshot_cache = OrderedDict()
+
+
+def backoff_delay(attempt: int) -> float:
+    """
+    Jittered exponential backoff ("full jitter")
+
+        Parameters:
+            attempt (int): The number of failures so far (1-based)
+
+        Returns:
+            float: Seconds to wait before the next attempt
+    """
+    return random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** (attempt - 1)))
+
+
+def endpoint_available(endpoint: str) -> bool:
+    """
+    Check whether the circuit for an endpoint currently accepts requests
+    """
+    return breakers[endpoint].state != "open"
+
+
+def _get(url: str) -> requests.Response:
+    return requests.get(url, headers={}, timeout=REQUEST_TIMEOUT)
+
+
+async def _hedged_get(url: str, hedge: bool = True) -> requests.Response:
+    """
+    Issue a request and, if it has not answered within HEDGE_DELAY seconds,
+    a second identical one. The first response to arrive wins.
+    """
+    primary = asyncio.ensure_future(asyncio.to_thread(_get, url))
+    if not hedge or HEDGE_DELAY <= 0:
+        return await primary
+
+    done, _ = await asyncio.wait({primary}, timeout=HEDGE_DELAY)
+    if done:
+        return primary.result()
+
+    hedge = asyncio.ensure_future(asyncio.to_thread(_get, url))
+    pending = {primary, hedge}
+    error = None
+    while pending:
+        done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            if task.exception() is None:
+                for other in pending:
+                    other.cancel()
+                return task.result()
+            error = task.exception()
+    raise error
+
+
+def _prune_snapshots():
+    cutoff = time.monotonic() - MAX_STALE
+    while snapshot_cache and (
+        len(snapshot_cache) > SNAPSHOT_CACHE_SIZE
+        or next(iter(snapshot_cache.values()))[0] < cutoff
+    ):
+        snapshot_cache.popitem(last=False)
+
+
+def _store_snapshot(url: str, pairs: list):
+    snapshot_cache[url] = (time.monotonic(), pairs)
+    snapshot_cache.move_to_end(url)
+    _prune_snapshots()
+
+
+def _serve_stale(url: str, reason: str) -> list:
+    _prune_snapshots()
+    cached = snapshot_cache.get(url)
+    if cached and time.monotonic() - cached[0] <= MAX_STALE:
+        logging.warning(f"Serving stale snapshot for {url}: {reason}")
+        return cached[1]
+    raise UpstreamError(reason)
+
+
+# -------------------- Parsing ------------------------------------------------
+
+parse_executor = None
+parse_slots = asyncio.Semaphore(PARSE_MAX_PENDING)
+
+
+def get_parse_executor() -> Executor:
+    """
+    Lazily create the worker pool used to decode and validate responses
+    """
+    global parse_executor
+    if parse_executor is None:
+        if PARSE_EXECUTOR == "process":
+            parse_executor = ProcessPoolExecutor(max_workers=PARSE_WORKERS)
+        else:
+            parse_executor = ThreadPoolExecutor(
+                max_workers=PARSE_WORKERS, thread_name_prefix="parse"
+            )
+    return parse_executor
+
+
+def decode_pairs(content: bytes) -> list:
+    """
+    Decode a DexScreener response body and validate its pairs. Runs in a worker,
+    so it must stay a picklable module-level function.
+
+        Parameters:
+            content (bytes): The raw response body
+
+        Returns:
+            list: The validated pairs (empty if there are none)
+    """
+    try:
+        data = json.loads(content)
+        if not isinstance(data, dict):
+            raise ValueError(f"Expected a JSON object, got {type(data).__name__}")
+        pairs = data.get("pairs") or []
+        if not isinstance(pairs, list) or not all(isinstance(p, dict) for p in pairs):
+            raise ValueError("Expected 'pairs' to be a list of objects")
+        return [Pair(**pair) for pair in pairs]
+    except ValueError as e:
+        # Re-raise as a plain ValueError: validation errors don't pickle cleanly
+        raise ValueError(str(e)) from None
+
+
+async def parse_pairs(content: bytes) -> list:
+    """
+    Decode a response body in the parse pool. At most PARSE_MAX_PENDING bodies
+    are queued or in flight; further callers wait for a slot. If a worker dies
+    the pool is replaced and the parse retried once.
+    """
+    global parse_executor
+    async with parse_slots:
+        loop = asyncio.get_running_loop()
+        for attempt in range(2):
+            executor = get_parse_executor()
+            try:
+                return await loop.run_in_executor(executor, decode_pairs, content)
+            except BrokenExecutor:
+                if parse_executor is executor:
+                    parse_executor = None
+                if attempt:
+                    raise
+
+
+# -------------------- Fetching -----------------------------------------------
+
+
+async def fetch_pairs(
+    endpoint: str,
+    url: str,
+    attempts: int = MAX_RETRIES,
+    hedge: bool = True,
+    negative: bool = True,
+) -> list:
+    """
+    Fetch the pairs for a DexScreener url through the endpoint's circuit
+    breaker, retrying with jittered backoff. Falls back to the last cached
+    snapshot when the upstream is unavailable.
+
+        Parameters:
+            endpoint (str): The breaker to use ("tokens" or "search")
+            url (str): The url to fetch
+            attempts (int): Maximum number of requests, retries included
+            hedge (bool): Whether a slow request may be hedged
+            negative (bool): Whether a cached "no pairs" answer may be served
+
+        Returns:
+            list: The pairs in the response (empty if there are none)
+
+        Raises:
+            UpstreamError: If the fetch failed and no fresh-enough snapshot exists
+    """
+    # Lookups known to return nothing are answered without an upstream call
+    _prune_snapshots()
+    if negative and url not in snapshot_cache and await negative_cache.contains(url):
+        return []
+
+    breaker = breakers[endpoint]
+    reason = "circuit open"
+    for attempt in range(1, attempts + 1):
+        if not breaker.allow():
+            break
+
+        try:
+            response = await _hedged_get(url, hedge)
+            if response.status_code != 200:
+                raise UpstreamError(f"status {response.status_code}")
+            pairs = await parse_pairs(response.content)
+        except BrokenExecutor as e:
+            # The upstream answered; only the local parse pool failed
+            breaker.record_success()
+            return _serve_stale(url, f"parse pool failed: {e}")
+        except (requests.RequestException, ValueError, UpstreamError) as e:
+            breaker.record_failure()
+            reason = str(e) or type(e).__name__
+            logging.warning(f"Fetch failed ({attempt}/{attempts}) for {url}: {reason}")
+            if attempt < attempts:
+                await asyncio.sleep(backoff_delay(attempt))
+            continue
+        except BaseException:
+            # Cancelled or failed locally: not the upstream's fault, but the
+            # half-open probe slot must be freed
+            breaker.release_probe()
+            raise
+
+        breaker.record_success()
+        if pairs:
+            _store_snapshot(url, pairs)
+        else:
+            snapshot_cache.pop(url, None)
+            await negative_cache.add(url)
+        return pairs
+
+    return _serve_stale(url, reason)
+
 
 # -------------------- API Functions ------------------------------------------
 
@@ -17,16 +335,12 @@ async def is_valid_coin(address: str) -> bool:
         Returns:
             bool: True if the coin is valid, False otherwise
     """
-    response = requests.get(
-        f"https://api.dexscreener.com/latest/dex/tokens/{address}",
-        headers={},
-    )
-    if response.status_code != 200:
-        # log error
+    try:
+        pairs = await fetch_pairs("tokens", TOKENS_URL.format(address))
+    except UpstreamError:
         return False
 
-    data = response.json()
-    return data.get("pairs") is not None
+    return len(pairs) > 0
 
 
 # -------------------- Helper Functions ---------------------------------------
@@ -40,11 +354,23 @@ async def get_market_cap(address: str) -> float:
             pair (Pair): The pair to get the market cap for
 
         Returns:
-            float: The market cap of the pair
+            float: The market cap of the pair, or None if the address does not
+                   match exactly one pair
+
+        Raises:
+            UpstreamError: If the upstream is unavailable
     """
-    pairs = await search_pairs(address)
+    # Alert polls are paced by the fair poller, so a poll may only cost one
+    # upstream request: no hedging, and retries come from the alert's backoff.
+    # They also skip the negative cache: a false positive there would make a
+    # valid alert look invalid and remove it.
+    pairs = await fetch_pairs(
+        "search", SEARCH_URL.format(address), attempts=1, hedge=False, negative=False
+    )
     if not pairs or len(pairs) > 1:
-        print(f"Error: Invalid pair - too many pairs returned: {len(pairs)}")
+        logging.error(
+            f"Invalid pair - expected 1 pair, got {len(pairs) if pairs else 0}"
+        )
         return None
     pair = pairs[0]
     return pair.marketCap if pair.marketCap else 0.0
@@ -79,24 +405,13 @@ async def search_pairs(query: str) -> list:
         Returns:
            array: An array of token pairs matching the query
     """
-    response = requests.get(
-        f"https://api.dexscreener.com/latest/dex/search?q={query}",
-        headers={},
-    )
-    if response.status_code != 200:
-        # log error
-        return None
-
-    data = response.json()
-    if data.get("pairs") is None:
-        # log error
+    try:
+        pairs = await fetch_pairs("search", SEARCH_URL.format(query))
+    except UpstreamError as e:
+        logging.error(f"Search failed for {query}: {e}")
         return None
 
-    pairs = []
-    for pair in data.get("pairs"):
-        pairs.append(Pair(**pair))
-
-    return pairs
+    return pairs or None
 
 
 def display_pair(pair: Pair) -> str:
@@ -0,0 +1,248 @@
+import argparse
+import asyncio
+import time
+from collections import Counter
+
+from data import UpstreamError, backoff_delay
+from polling import UPSTREAM_RPS, FairPoller
+from sources import PAUSE_AFTER, POLL_INTERVAL, PriceSource, ReplaySource
+
+# -------------------- Alert Evaluation ---------------------------------------
+
+
+def threshold_crossed(direction: str, value: float, threshold: float) -> bool:
+    """
+    Check whether a value has crossed a threshold in the given direction
+
+        Parameters:
+            direction (str): "above" or "below"
+            value (float): The current metric value
+            threshold (float): The alert threshold
+
+        Returns:
+            bool: True if the alert should trigger
+    """
+    return (direction == "above" and value > threshold) or (
+        direction == "below" and value < threshold
+    )
+
+
+class AlertState:
+    """
+    What an alert remembers between evaluations.
+    """
+
+    def __init__(self):
+        self.failed_attempts = 0  # consecutive upstream failures
+        self.paused = False
+
+
+async def evaluate_once(fetch, alert: dict, state: AlertState, on_event) -> bool:
+    """
+    Run one evaluation step of an alert, reporting what happened through
+    `on_event(event, value)`. Events are "paused", "resumed", "checked",
+    "triggered" and "invalid".
+
+        Parameters:
+            fetch (coroutine function): (address, metric) -> value
+            alert (dict): The alert's address, metric, direction and threshold
+            state (AlertState): The alert's state, updated in place
+            on_event (coroutine function): Called for each event
+
+        Returns:
+            bool: True once the alert is finished (triggered or invalid)
+    """
+    try:
+        value = await fetch(alert["address"], alert["metric"])
+    except UpstreamError:
+        state.failed_attempts += 1
+        if state.failed_attempts >= PAUSE_AFTER and not state.paused:
+            # Pause instead of cancelling: keep polling with backoff until the
+            # upstream recovers or the alert expires
+            state.paused = True
+            await on_event("paused", None)
+        return False
+
+    if value is None:
+        # The upstream answered, but not with a single pair: retrying won't help
+        await on_event("invalid", None)
+        return True
+
+    state.failed_attempts = 0
+    if state.paused:
+        state.paused = False
+        await on_event("resumed", value)
+
+    if threshold_crossed(alert["direction"], value, alert["threshold"]):
+        await on_event("triggered", value)
+        return True
+
+    await on_event("checked", value)
+    return False
+
+
+def next_delay(state: AlertState, interval: float) -> float:
+    """
+    Seconds to wait before the next evaluation step
+    """
+    if state.failed_attempts:
+        return max(interval, backoff_delay(state.failed_attempts))
+    return interval
+
+
+async def watch_alert(
+    source: PriceSource, alert: dict, fetch, interval, is_active, on_event
+) -> bool:
+    """
+    Evaluate an alert until it finishes, stops being active or the source is
+    exhausted. This is the loop both the bot and backtests run.
+
+        Parameters:
+            source (PriceSource): The source whose clock paces the alert
+            alert (dict): The alert's address, metric, direction and threshold
+            fetch (coroutine function): (address, metric) -> value
+            interval (function): () -> seconds between evaluations
+            is_active (coroutine function): () -> whether the alert should keep running
+            on_event (coroutine function): Called for each event
+
+        Returns:
+            bool: True if the alert finished, False if it expired
+    """
+    state = AlertState()
+    while not source.exhausted and await is_active():
+        if await evaluate_once(fetch, alert, state, on_event):
+            return True
+        await source.sleep(next_delay(state, interval()))
+    return False
+
+
+async def evaluate_alerts(
+    source: ReplaySource, alerts: list[dict], poller: FairPoller
+) -> dict:
+    """
+    Evaluate alerts concurrently against a replay source until all have
+    finished or the source is exhausted.
+
+    Values are read straight from the source, but each alert is registered
+    with `poller` and waits its stretched interval, as it would live.
+
+        Parameters:
+            source (ReplaySource): Where metric values come from
+            alerts (list): Dicts with address, metric, direction and threshold,
+                           and optionally user_id and guild_id
+            poller (FairPoller): Supplies quotas and load shedding
+
+        Returns:
+            dict: "triggered" maps alert index to (timestamp, value);
+                  "evaluations" is the number of threshold checks made;
+                  "events" counts every event by name
+    """
+    triggered = {}
+    events = Counter()
+
+    async def always_active() -> bool:
+        return True
+
+    async def watch(i: int, alert: dict):
+        user_id, guild_id = alert.get("user_id", i), alert.get("guild_id")
+
+        async def on_event(event: str, value: float):
+            events[event] += 1
+            if event == "triggered":
+                triggered[i] = (source.now(), value)
+
+        poller.register(user_id, guild_id)
+        try:
+            await watch_alert(
+                source,
+                alert,
+                source.get_value,
+                lambda: poller.interval(user_id, guild_id),
+                always_active,
+                on_event,
+            )
+        finally:
+            poller.unregister(user_id, guild_id)
+
+    tasks = {asyncio.ensure_future(watch(i, alert)) for i, alert in enumerate(alerts)}
+    await source.run(tasks)
+    return {
+        "triggered": triggered,
+        "evaluations": events["checked"] + events["triggered"],
+        "events": events,
+    }
+
+
+# -------------------- Backtest CLI -------------------------------------------
+
+
+def parse_strategy(text: str) -> tuple:
+    """
+    Parse a "direction:threshold" strategy, e.g. "above:1000000"
+    """
+    direction, threshold = text.split(":", 1)
+    if direction not in ("above", "below"):
+        raise argparse.ArgumentTypeError(f"Invalid direction: {direction}")
+    return direction, float(threshold)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Backtest alert thresholds against recorded snapshots."
+    )
+    parser.add_argument("snapshots", help="JSONL file of recorded snapshots")
+    parser.add_argument(
+        "strategies",
+        nargs="+",
+        type=parse_strategy,
+        help="direction:threshold pairs, e.g. above:1000000 below:500000",
+    )
+    parser.add_argument("--metric", default="market_cap")
+    parser.add_argument("--interval", type=float, default=POLL_INTERVAL)
+    parser.add_argument(
+        "--rate",
+        type=float,
+        default=None,
+        help="Upstream requests per second to simulate (default: UPSTREAM_RPS)",
+    )
+    parser.add_argument(
+        "--speed",
+        type=float,
+        default=0.0,
+        help="Replay speed multiplier (0 = as fast as possible)",
+    )
+    args = parser.parse_args()
+
+    poller = FairPoller(rate=args.rate or UPSTREAM_RPS, base_interval=args.interval)
+
+    source = ReplaySource.from_file(args.snapshots, args.speed)
+    alerts = [
+        {
+            "address": address,
+            "metric": metric,
+            "direction": direction,
+            "threshold": threshold,
+        }
+        for address, metric in source.series
+        if metric == args.metric
+        for direction, threshold in args.strategies
+    ]
+
+    started = time.perf_counter()
+    result = asyncio.run(evaluate_alerts(source, alerts, poller))
+    elapsed = time.perf_counter() - started
+
+    for i, alert in enumerate(alerts):
+        hit = result["triggered"].get(i)
+        outcome = f"triggered at {hit[0]:.0f} (value {hit[1]})" if hit else "never"
+        print(
+            f"{alert['address']} {alert['metric']} {alert['direction']} {alert['threshold']}: {outcome}"
+        )
+
+    print(" | ".join(f"{event}: {n}" for event, n in sorted(result["events"].items())))
+    rate = result["evaluations"] / elapsed if elapsed > 0 else float("inf")
+    print(f"{result['evaluations']} evaluations in {elapsed:.3f}s ({rate:.0f}/s)")
+
+
+if __name__ == "__main__":
+    main()
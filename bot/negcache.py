@@ -0,0 +1,96 @@
+import hashlib
+import logging
+import os
+import time
+
+import redis
+import redis.asyncio as aioredis
+
+# -------------------- Negative Cache -----------------------------------------
+
+REDIS_HOST = os.getenv("REDIS_HOST", "localhost")
+REDIS_PORT = int(os.getenv("REDIS_PORT", 6379))
+NEGATIVE_TTL = int(os.getenv("NEGATIVE_TTL", 300))  # seconds per generation
+NEGATIVE_BITS = int(os.getenv("NEGATIVE_BITS", 2**20))  # bits per filter (128 KiB)
+NEGATIVE_HASHES = int(os.getenv("NEGATIVE_HASHES", 7))  # bits set per lookup
+NEGATIVE_TIMEOUT = float(os.getenv("NEGATIVE_TIMEOUT", 0.5))  # seconds per call
+
+
+class NegativeCache:
+    """
+    Remembers lookups that returned no pairs in a Bloom filter stored as a
+    Redis bitmap, so every bot process shares it.
+
+    Entries expire by generation: each `ttl` seconds writes go to a new
+    filter, and reads check the current and previous one, so a negative is
+    remembered for between `ttl` and `2 * ttl` seconds. A false positive only
+    hides a real result until its generation expires. Redis errors and
+    timeouts fail open.
+    """
+
+    def __init__(
+        self,
+        client: aioredis.Redis,
+        ttl: int = NEGATIVE_TTL,
+        bits: int = NEGATIVE_BITS,
+        hashes: int = NEGATIVE_HASHES,
+        prefix: str = "negbloom",
+    ):
+        self.client = client
+        self.ttl = ttl
+        self.bits = bits
+        self.hashes = hashes
+        self.prefix = prefix
+
+    def offsets(self, key: str) -> list[int]:
+        # Double hashing: h1 + i * h2 gives k independent-enough positions
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.bits for i in range(self.hashes)]
+
+    def generation(self) -> int:
+        return int(time.time() // self.ttl)
+
+    async def add(self, key: str):
+        """
+        Record that a lookup returned no pairs
+        """
+        name = f"{self.prefix}:{self.generation()}"
+        try:
+            pipe = self.client.pipeline(transaction=False)
+            for offset in self.offsets(key):
+                pipe.setbit(name, offset, 1)
+            pipe.expire(name, self.ttl * 2)
+            await pipe.execute()
+        except redis.RedisError as e:
+            logging.warning(f"Negative cache write failed: {e}")
+
+    async def contains(self, key: str) -> bool:
+        """
+        Check whether a lookup is known to return no pairs
+        """
+        gen = self.generation()
+        offsets = self.offsets(key)
+        try:
+            pipe = self.client.pipeline(transaction=False)
+            for name in (f"{self.prefix}:{gen}", f"{self.prefix}:{gen - 1}"):
+                for offset in offsets:
+                    pipe.getbit(name, offset)
+            bits = await pipe.execute()
+        except redis.RedisError as e:
+            logging.warning(f"Negative cache read failed: {e}")
+            return False
+
+        return all(bits[: self.hashes]) or all(bits[self.hashes :])
+
+
+negative_cache = NegativeCache(
+    aioredis.Redis(
+        host=REDIS_HOST,
+        port=REDIS_PORT,
+        decode_responses=True,
+        socket_timeout=NEGATIVE_TIMEOUT,
+        socket_connect_timeout=NEGATIVE_TIMEOUT,
+    )
+)
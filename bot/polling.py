@@ -0,0 +1,192 @@
+import asyncio
+import heapq
+import itertools
+import os
+import time
+from collections import Counter
+
+from sources import POLL_INTERVAL
+
+# -------------------- Fair Polling -------------------------------------------
+
+UPSTREAM_RPS = float(os.getenv("UPSTREAM_RPS", 4))  # upstream requests per second
+USER_QUOTA = int(os.getenv("USER_QUOTA", 5))  # alerts per user at full speed
+GUILD_QUOTA = int(os.getenv("GUILD_QUOTA", 50))  # alerts per guild at full speed
+# Relative shares of the budget, e.g. "1234:2,5678:0.5" (unlisted users get 1)
+USER_WEIGHTS = {
+    int(user_id): float(weight)
+    for user_id, weight in (
+        item.split(":") for item in os.getenv("USER_WEIGHTS", "").split(",") if item
+    )
+}
+
+
+class FairPoller:
+    """
+    Shares the upstream request budget between users.
+
+    Polls are queued per user and dispatched in weighted-fair-queue order at
+    no more than `rate` polls per second. Each poll must cost at most one
+    upstream request (see get_market_cap), so a user with many alerts only
+    delays their own polls. Alerts are never rejected: when a user or guild is
+    over quota, or total demand exceeds the budget, `interval` stretches the
+    time between polls instead.
+    """
+
+    def __init__(
+        self,
+        rate: float = UPSTREAM_RPS,
+        user_quota: int = USER_QUOTA,
+        guild_quota: int = GUILD_QUOTA,
+        base_interval: float = POLL_INTERVAL,
+        weights: dict = None,
+    ):
+        self.rate = rate
+        self.user_quota = user_quota
+        self.guild_quota = guild_quota
+        self.base_interval = base_interval
+        self.weights = dict(USER_WEIGHTS if weights is None else weights)
+
+        self.user_alerts = Counter()
+        self.guild_alerts = Counter()
+        self.user_polls = Counter()
+
+        self.queue = []  # heap of (finish tag, seq, user_id, future, fetch, args)
+        self.seq = itertools.count()
+        self.virtual_time = 0.0
+        self.last_finish = {}  # user_id -> finish tag of their last queued poll
+        self.wakeup = asyncio.Event()
+        self.dispatcher = None
+        self.running = set()  # keep references to in-flight fetch tasks
+
+    # ---- admission ----------------------------------------------------------
+
+    def register(self, user_id, guild_id):
+        self.user_alerts[user_id] += 1
+        if guild_id is not None:
+            self.guild_alerts[guild_id] += 1
+
+    def unregister(self, user_id, guild_id):
+        self.user_alerts[user_id] -= 1
+        if self.user_alerts[user_id] <= 0:
+            del self.user_alerts[user_id]
+            self.last_finish.pop(user_id, None)
+            self.user_polls.pop(user_id, None)
+        if guild_id is not None:
+            self.guild_alerts[guild_id] -= 1
+            if self.guild_alerts[guild_id] <= 0:
+                del self.guild_alerts[guild_id]
+
+    def set_weight(self, user_id, weight: float):
+        """
+        Give a user a larger (> 1) or smaller (< 1) share of the budget
+        """
+        if weight <= 0:
+            raise ValueError("Weight must be positive")
+        self.weights[user_id] = weight
+
+    def interval(self, user_id, guild_id) -> float:
+        """
+        Seconds an alert of this user should wait between polls.
+
+        The base interval is stretched by how far the user and guild are over
+        their quotas, and by how far total demand exceeds the request budget.
+        """
+        factor = max(self.load(), self.user_alerts[user_id] / self.user_quota)
+        if guild_id is not None:
+            factor = max(factor, self.guild_alerts[guild_id] / self.guild_quota)
+        return self.base_interval * factor
+
+    def load(self) -> float:
+        """
+        Requests per second wanted at the base interval over the budget (>= 1)
+        """
+        demand = sum(self.user_alerts.values()) / self.base_interval
+        return max(1.0, demand / self.rate)
+
+    # ---- scheduling ---------------------------------------------------------
+
+    async def poll(self, user_id, fetch, *args):
+        """
+        Queue `fetch(*args)` on behalf of a user and wait for its result
+        """
+        if self.dispatcher is None or self.dispatcher.done():
+            self.dispatcher = asyncio.create_task(self.dispatch())
+
+        weight = self.weights.get(user_id, 1.0)
+        start = max(self.virtual_time, self.last_finish.get(user_id, 0.0))
+        finish = start + 1.0 / weight
+        self.last_finish[user_id] = finish
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(
+            self.queue, (finish, next(self.seq), user_id, future, fetch, args)
+        )
+        self.wakeup.set()
+        return await future
+
+    async def dispatch(self):
+        next_slot = time.monotonic()
+        while True:
+            if not self.queue:
+                self.wakeup.clear()
+                await self.wakeup.wait()
+                continue
+
+            delay = next_slot - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            next_slot = max(next_slot, time.monotonic()) + 1.0 / self.rate
+
+            finish, _, user_id, future, fetch, args = heapq.heappop(self.queue)
+            self.virtual_time = finish
+            if future.done():  # caller went away
+                continue
+            self.user_polls[user_id] += 1
+            task = asyncio.create_task(self.run(future, fetch, args))
+            self.running.add(task)
+            task.add_done_callback(self.running.discard)
+
+    @staticmethod
+    async def run(future, fetch, args):
+        try:
+            result = await fetch(*args)
+        except Exception as e:
+            # Hand the error to the caller, which knows how to react to it
+            if not future.done():
+                future.set_exception(e)
+            return
+        if not future.done():
+            future.set_result(result)
+
+    # ---- reporting ----------------------------------------------------------
+
+    def usage(self) -> dict:
+        """
+        Current usage per tenant: alerts, polls served, queued polls and the
+        effective poll interval
+        """
+        queued = Counter(item[2] for item in self.queue)
+        return {
+            "users": {
+                user_id: {
+                    "alerts": alerts,
+                    "polls": self.user_polls[user_id],
+                    "queued": queued[user_id],
+                    "weight": self.weights.get(user_id, 1.0),
+                    "interval": self.interval(user_id, None),
+                }
+                for user_id, alerts in self.user_alerts.items()
+            },
+            "guilds": {
+                guild_id: {
+                    "alerts": alerts,
+                    "interval": self.base_interval
+                    * max(self.load(), alerts / self.guild_quota),
+                }
+                for guild_id, alerts in self.guild_alerts.items()
+            },
+            "queued": len(self.queue),
+            "rate": self.rate,
+            "load": self.load(),
+        }
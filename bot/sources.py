@@ -0,0 +1,193 @@
+import asyncio
+import bisect
+import heapq
+import itertools
+import json
+import logging
+import time
+
+from data import UpstreamError, get_market_cap
+
+# -------------------- Price Sources ------------------------------------------
+
+POLL_INTERVAL = 5  # seconds between checks of an alert
+PAUSE_AFTER = 3  # consecutive upstream failures before an alert is paused
+
+
+class PriceSource:
+    """
+    Interface between the alert-evaluation engine and where metric values come
+    from. A source also owns the clock, so replayed data can run faster than
+    real time.
+    """
+
+    async def get_value(self, address: str, metric: str) -> float:
+        """
+        Get the current value of a metric for a pair
+
+            Parameters:
+                address (str): The pair address
+                metric (str): The metric to read (e.g. "market_cap")
+
+            Returns:
+                float: The metric value, or None if the pair/metric does not exist
+
+            Raises:
+                UpstreamError: If the value is temporarily unavailable
+        """
+        raise NotImplementedError
+
+    async def sleep(self, seconds: float):
+        """
+        Wait for `seconds` of source time to pass
+        """
+        raise NotImplementedError
+
+    def now(self) -> float:
+        """
+        The current source time as a unix timestamp
+        """
+        raise NotImplementedError
+
+    @property
+    def exhausted(self) -> bool:
+        """
+        True once the source has no more data to offer
+        """
+        return False
+
+
+class DexScreenerSource(PriceSource):
+    """
+    Live source that polls the DexScreener API in real time.
+    """
+
+    async def get_value(self, address: str, metric: str) -> float:
+        if metric != "market_cap":
+            logging.warning(f"Unsupported metric: {metric}.")
+            return None
+
+        return await get_market_cap(address)
+
+    async def sleep(self, seconds: float):
+        await asyncio.sleep(seconds)
+
+    def now(self) -> float:
+        return time.time()
+
+
+class ReplaySource(PriceSource):
+    """
+    Source that replays recorded snapshots on a virtual clock.
+
+    Each snapshot is a dict with a `timestamp` (unix seconds) and either
+    `address`, `metric` (default "market_cap") and `value`, or a raw DexScreener
+    `pair` object whose pairAddress and marketCap are used.
+
+    The clock only moves in `run`, which advances it to the earliest pending
+    `sleep` once every evaluation task is asleep, so concurrent alerts share
+    one timeline. With `speed=0` it advances as fast as the engine can
+    evaluate; otherwise it runs `speed` times faster than real time.
+    """
+
+    def __init__(self, snapshots: list[dict], speed: float = 0.0):
+        self.speed = speed
+        self.series = {}  # (address, metric) -> ([timestamps], [values])
+        self.sleepers = []  # heap of (wake time, seq, future)
+        self.seq = itertools.count()
+        self.sleeping = asyncio.Event()
+
+        for snapshot in sorted(snapshots, key=lambda s: s["timestamp"]):
+            pair = snapshot.get("pair")
+            if pair is not None:
+                key = (pair["pairAddress"], "market_cap")
+                value = pair.get("marketCap")
+            else:
+                key = (snapshot["address"], snapshot.get("metric", "market_cap"))
+                value = snapshot.get("value")
+            timestamps, values = self.series.setdefault(key, ([], []))
+            timestamps.append(float(snapshot["timestamp"]))
+            values.append(float(value) if value else 0.0)  # as get_market_cap
+
+        starts = [timestamps[0] for timestamps, _ in self.series.values()]
+        ends = [timestamps[-1] for timestamps, _ in self.series.values()]
+        self.clock = min(starts) if starts else 0.0
+        self.end = max(ends) if ends else 0.0
+
+    @classmethod
+    def from_file(cls, path: str, speed: float = 0.0) -> "ReplaySource":
+        """
+        Load snapshots from a JSONL file (one snapshot per line)
+        """
+        snapshots = []
+        with open(path) as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    snapshots.append(json.loads(line))
+        return cls(snapshots, speed)
+
+    async def get_value(self, address: str, metric: str) -> float:
+        series = self.series.get((address, metric))
+        if series is None:
+            return None
+
+        timestamps, values = series
+        i = bisect.bisect_right(timestamps, self.clock)
+        if i == 0:
+            raise UpstreamError(f"No snapshot for {address} yet")
+        return values[i - 1]
+
+    async def sleep(self, seconds: float):
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self.sleepers, (self.clock + seconds, next(self.seq), future))
+        self.sleeping.set()
+        await future
+
+    async def advance(self):
+        """
+        Move the clock to the earliest pending sleep and wake everyone due
+        """
+        if not self.sleepers:
+            return
+
+        target = self.sleepers[0][0]
+        if self.speed > 0 and target > self.clock:
+            await asyncio.sleep((target - self.clock) / self.speed)
+        self.clock = max(self.clock, target)
+        while self.sleepers and self.sleepers[0][0] <= self.clock:
+            _, _, future = heapq.heappop(self.sleepers)
+            if not future.done():
+                future.set_result(None)
+
+    async def run(self, tasks: set):
+        """
+        Drive the clock until every task has finished
+
+            Parameters:
+                tasks (set): The evaluation tasks sleeping on this source
+        """
+        pending = set(tasks)
+        while pending:
+            # Let every task run until it finishes or goes to sleep
+            while pending and len(self.sleepers) < len(pending):
+                self.sleeping.clear()
+                waiter = asyncio.ensure_future(self.sleeping.wait())
+                done, _ = await asyncio.wait(
+                    pending | {waiter}, return_when=asyncio.FIRST_COMPLETED
+                )
+                waiter.cancel()
+                pending -= done
+            if pending:
+                await self.advance()
+
+        # Surface any exception raised by a task
+        for task in tasks:
+            task.result()
+
+    def now(self) -> float:
+        return self.clock
+
+    @property
+    def exhausted(self) -> bool:
+        return self.clock > self.end